@@ -0,0 +1,133 @@
+# 檔案: benchmark_detectors.py
+# 用途: 在錄好的影格上比較各偵測後端的速度 (FPS) 與辨識一致性
+# 執行:
+#   python benchmark_detectors.py frames/ ultralytics:best.pt onnx:best.onnx
+#   python benchmark_detectors.py game.mp4 ultralytics:best.pt onnx:best.onnx --threads 4 --roi
+#
+# 第一個後端視為基準，其餘後端與它比較:
+#   - 手牌一致率: 手牌辨識結果 (牌名多重集合) 完全相同的影格比例
+#   - 牌張一致度: 手牌 + 場上牌的 F1 (以牌名多重集合計算)
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+try:
+    import cv2
+    import vision_bridge
+    from detectors import load_detector
+except ImportError as e:
+    print(f"[Error] Missing dependency: {e}")
+    print("Please install required packages:")
+    print("pip install ultralytics onnxruntime opencv-python numpy")
+    sys.exit(1)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+WARMUP_FRAMES = 3
+RECORDED_FPS = 30.0  # 錄影的影格率 (ROI 模式換算牌河更新時間用)
+
+
+def load_frames(source: str, limit: int | None = None) -> list:
+    """讀取影格: 圖片資料夾 (依檔名排序) 或影片檔。"""
+    frames = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(source, name))
+                if frame is not None:
+                    frames.append(frame)
+            if limit and len(frames) >= limit:
+                break
+    else:
+        cap = cv2.VideoCapture(source)
+        while not limit or len(frames) < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    return frames
+
+
+def run_backend(detector, frames: list, use_roi: bool) -> tuple[float, list]:
+    """
+    對所有影格執行辨識。
+
+    回傳: (fps, [(hand_tiles, visible_tiles), ...])
+    """
+    detect = vision_bridge.detect_tiles_roi if use_roi else vision_bridge.detect_tiles_full_frame
+
+    # 暖機 (載入權重、配置記憶體等不計入時間)
+    for frame in frames[:WARMUP_FRAMES]:
+        detector.detect(frame)
+
+    # 每個後端各自一份牌河快取；錄影以固定 FPS 換算影格時間，
+    # 讓牌河更新頻率與後端速度無關，結果才能互相比較
+    river_cache = vision_bridge.RiverCache()
+    outputs = []
+    start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        if use_roi:
+            outputs.append(detect(frame, detector, river_cache, i / RECORDED_FPS))
+        else:
+            outputs.append(detect(frame, detector))
+    elapsed = time.perf_counter() - start
+
+    return len(frames) / elapsed, outputs
+
+
+def _f1(reference: list[str], other: list[str]) -> float:
+    if not reference and not other:
+        return 1.0
+    common = sum((Counter(reference) & Counter(other)).values())
+    return 2 * common / (len(reference) + len(other))
+
+
+def compare(reference: list, other: list) -> dict:
+    """比較兩個後端在每個影格的辨識結果。"""
+    hand_match = 0
+    f1_total = 0.0
+    for (ref_hand, ref_vis), (hand, vis) in zip(reference, other):
+        hand_match += Counter(ref_hand) == Counter(hand)
+        f1_total += _f1(ref_hand + ref_vis, hand + vis)
+    n = len(reference) or 1
+    return {'handAgreement': hand_match / n, 'tileF1': f1_total / n}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="偵測後端效能與一致性比較")
+    parser.add_argument('source', help="影格資料夾或影片檔")
+    parser.add_argument('backends', nargs='+', help="後端:模型路徑，例如 onnx:best.onnx")
+    parser.add_argument('--imgsz', type=int, default=640, help="ONNX 輸入尺寸")
+    parser.add_argument('--threads', type=int, default=None, help="ONNX 執行緒數")
+    parser.add_argument('--limit', type=int, default=None, help="最多讀取的影格數")
+    parser.add_argument('--roi', action='store_true', help="使用手牌/牌河分區推論")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.limit)
+    if not frames:
+        print(f"[Error] No frames loaded from: {args.source}")
+        return
+    print(f"Loaded {len(frames)} frames from {args.source}\n")
+
+    results = []
+    for spec in args.backends:
+        backend, _, model_path = spec.partition(':')
+        detector = load_detector(backend, model_path, imgsz=args.imgsz, threads=args.threads)
+        fps, outputs = run_backend(detector, frames, args.roi)
+        results.append((spec, fps, outputs))
+
+    reference_spec, reference_fps, reference = results[0]
+    print(f"{'backend':<32}{'fps':>8}{'speedup':>9}{'hand agree':>12}{'tile F1':>9}")
+    for spec, fps, outputs in results:
+        agreement = compare(reference, outputs)
+        print(
+            f"{spec:<32}{fps:>8.2f}{fps / reference_fps:>8.2f}x"
+            f"{agreement['handAgreement'] * 100:>11.1f}%{agreement['tileF1']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
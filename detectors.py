@@ -0,0 +1,261 @@
+# 檔案: detectors.py
+# 麻將牌偵測後端 — 統一 ultralytics YOLO 與 CPU 最佳化的 ONNX Runtime
+# ──────────────────────────────────────────────────────────────
+# 每個後端都提供 detect(image, imgsz=None) -> list[Detection]，
+# vision_bridge.process_frame 只依賴這個介面，不必知道底層是哪種模型。
+#
+# 匯出 ONNX 模型 (ultralytics):
+#   yolo export model=best.pt format=onnx dynamic=True
+# 建議加 dynamic=True: 動態尺寸模型的輸入只補邊到 32 的倍數 (與 ultralytics
+# 推論時相同)，扁長的手牌條 / 牌河依實際比例推論，分區才有加速效果。
+# 固定尺寸匯出的模型只能吃匯出時的 H × W，每個分區都會補邊到這個尺寸，
+# 分區推論 (手牌 640 / 牌河 416) 指定的 imgsz 也會被忽略 (並發出警告)。
+#
+# 需要的套件:
+#   ultralytics 後端: pip install ultralytics
+#   onnx 後端:        pip install onnxruntime opencv-python numpy
+
+from __future__ import annotations
+
+import warnings
+from typing import NamedTuple
+
+BACKENDS = ('ultralytics', 'onnx')
+STRIDE = 32  # YOLOv8 最大下採樣倍數，動態尺寸輸入的邊長須為其倍數
+
+
+class Detection(NamedTuple):
+    """單一偵測結果 (座標為輸入影像的像素座標)。"""
+    xyxy: tuple[float, float, float, float]  # (x1, y1, x2, y2)
+    cls: int
+    conf: float
+
+
+class UltralyticsDetector:
+    """
+    包裝 ultralytics YOLO 模型 (PyTorch .pt，或任何 YOLO() 可載入的格式)。
+
+    參數:
+        model: 已載入的 YOLO 實例，或模型路徑
+    """
+
+    name = 'ultralytics'
+
+    def __init__(self, model):
+        if isinstance(model, str):
+            from ultralytics import YOLO
+            model = YOLO(model)
+        self.model = model
+
+    def detect(self, image, imgsz: int | None = None) -> list[Detection]:
+        kwargs = {'verbose': False}
+        if imgsz is not None:
+            kwargs['imgsz'] = imgsz
+        results = self.model(image, **kwargs)
+
+        detections = []
+        for box in results[0].boxes:
+            coords = box.xyxy[0]
+            detections.append(Detection(
+                (float(coords[0]), float(coords[1]), float(coords[2]), float(coords[3])),
+                int(box.cls[0]),
+                float(box.conf[0]),
+            ))
+        return detections
+
+
+class OnnxDetector:
+    """
+    以 ONNX Runtime (CPUExecutionProvider) 執行匯出的 YOLOv8 偵測模型。
+
+    參數:
+        model_path: .onnx 檔路徑
+        imgsz: 預設輸入尺寸 (縮放後的長邊)；模型若為固定尺寸則只能使用模型尺寸，
+            指定其他尺寸 (此處或 detect 的 imgsz) 會發出警告
+        threads: intra-op 執行緒數 (None = ONNX Runtime 預設)
+        conf_threshold: 低於此信心度的框直接丟棄
+        iou_threshold: NMS 的 IoU 門檻 (預設 0.7，與 ultralytics 相同)
+    """
+
+    name = 'onnx'
+
+    def __init__(
+        self,
+        model_path: str,
+        imgsz: int = 640,
+        threads: int | None = None,
+        conf_threshold: float = 0.25,
+        iou_threshold: float = 0.7,
+    ):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "ONNX 後端需要 onnxruntime: pip install onnxruntime"
+            ) from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+
+        # 固定尺寸匯出的輸入形狀為 [1, 3, H, W] (H, W 可不相等)；
+        # dynamic=True 匯出則為字串
+        height, width = model_input.shape[2], model_input.shape[3]
+        self.fixed_shape: tuple[int, int] | None = None
+        if isinstance(height, int) and isinstance(width, int):
+            self.fixed_shape = (height, width)
+
+        self._warned_sizes: set[int] = set()
+        self.imgsz = imgsz
+        self._check_size(imgsz)
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+
+    def _check_size(self, imgsz: int) -> None:
+        """固定尺寸模型一律使用模型尺寸；要求的尺寸不同時警告 (每種尺寸一次)。"""
+        if self.fixed_shape is None or imgsz == max(self.fixed_shape):
+            return
+        if imgsz not in self._warned_sizes:
+            self._warned_sizes.add(imgsz)
+            height, width = self.fixed_shape
+            warnings.warn(
+                f"ONNX 模型為固定輸入尺寸 {height}×{width}，忽略 imgsz={imgsz}；"
+                f"請以 dynamic=True 重新匯出 (yolo export model=best.pt format=onnx dynamic=True)",
+                stacklevel=3,
+            )
+
+    def _letterbox(self, image, size: int):
+        """
+        等比例縮放並補邊，回傳 (tensor, scale, pad_x, pad_y)。
+        固定尺寸模型補邊成模型的 H × W；動態尺寸模型長邊縮放到 size，
+        只補到最小的 STRIDE 倍數矩形 (與 ultralytics 的 auto=True 相同)。
+        """
+        import cv2
+        import numpy as np
+
+        h, w = image.shape[:2]
+        if self.fixed_shape is not None:
+            target_h, target_w = self.fixed_shape
+        else:
+            target_h = target_w = size
+        scale = min(target_h / h, target_w / w)
+        new_w, new_h = round(w * scale), round(h * scale)
+        if self.fixed_shape is None:
+            target_w = new_w + (-new_w) % STRIDE
+            target_h = new_h + (-new_h) % STRIDE
+        pad_x, pad_y = (target_w - new_w) / 2, (target_h - new_h) / 2
+
+        resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        top, bottom = round(pad_y - 0.1), round(pad_y + 0.1)
+        left, right = round(pad_x - 0.1), round(pad_x + 0.1)
+        padded = cv2.copyMakeBorder(
+            resized, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114)
+        )
+
+        # BGR HWC uint8 → RGB CHW float32 [0, 1]
+        tensor = padded[:, :, ::-1].transpose(2, 0, 1)
+        tensor = np.ascontiguousarray(tensor, dtype=np.float32)[None] / 255.0
+        return tensor, scale, left, top
+
+    def detect(self, image, imgsz: int | None = None) -> list[Detection]:
+        import numpy as np
+
+        size = imgsz or self.imgsz
+        self._check_size(size)
+        tensor, scale, pad_x, pad_y = self._letterbox(image, size)
+
+        # YOLOv8 輸出: [1, 4 + 類別數, 候選數] → [候選數, 4 + 類別數]
+        output = self.session.run(None, {self.input_name: tensor})[0][0].T
+        scores = output[:, 4:]
+        cls_ids = scores.argmax(axis=1)
+        confs = scores[np.arange(len(scores)), cls_ids]
+
+        keep = confs >= self.conf_threshold
+        boxes, cls_ids, confs = output[keep, :4], cls_ids[keep], confs[keep]
+        if not len(boxes):
+            return []
+
+        # (cx, cy, w, h) → 原圖 (x1, y1, x2, y2)
+        h, w = image.shape[:2]
+        xyxy = np.empty_like(boxes)
+        xyxy[:, 0] = (boxes[:, 0] - boxes[:, 2] / 2 - pad_x) / scale
+        xyxy[:, 1] = (boxes[:, 1] - boxes[:, 3] / 2 - pad_y) / scale
+        xyxy[:, 2] = (boxes[:, 0] + boxes[:, 2] / 2 - pad_x) / scale
+        xyxy[:, 3] = (boxes[:, 1] + boxes[:, 3] / 2 - pad_y) / scale
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+
+        indices = _nms_per_class(xyxy, confs, cls_ids, self.iou_threshold)
+        return [
+            Detection(tuple(float(v) for v in xyxy[i]), int(cls_ids[i]), float(confs[i]))
+            for i in indices
+        ]
+
+
+def _nms_per_class(xyxy, confs, cls_ids, iou_threshold: float) -> list[int]:
+    """
+    依類別分開做 NMS (與 ultralytics 預設相同)，回傳保留的索引 (信心度降序)。
+    """
+    import numpy as np
+
+    # 依類別平移座標，讓不同類別的框永遠不重疊，一次 NMS 即可
+    offset = cls_ids[:, None].astype(xyxy.dtype) * (float(xyxy.max()) + 1)
+    boxes = xyxy + offset
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    order = confs.argsort()[::-1]
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+
+        ix1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        iy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        ix2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        iy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = (ix2 - ix1).clip(0) * (iy2 - iy1).clip(0)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+
+        order = rest[iou <= iou_threshold]
+
+    return keep
+
+
+def as_detector(model):
+    """
+    將 YOLO 模型包裝成偵測後端；已經是後端 (有 detect 方法) 則原樣回傳。
+    """
+    if hasattr(model, 'detect'):
+        return model
+    return UltralyticsDetector(model)
+
+
+def load_detector(
+    backend: str,
+    model_path: str,
+    imgsz: int = 640,
+    threads: int | None = None,
+):
+    """
+    依名稱建立偵測後端。
+
+    參數:
+        backend: 'ultralytics' | 'onnx'
+        model_path: 模型檔 (.pt / .onnx)
+        imgsz: ONNX 後端的輸入尺寸
+        threads: ONNX 後端的執行緒數
+    """
+    if backend == 'ultralytics':
+        return UltralyticsDetector(model_path)
+    if backend == 'onnx':
+        return OnnxDetector(model_path, imgsz=imgsz, threads=threads)
+    raise ValueError(f"未知的偵測後端: {backend} (可用: {', '.join(BACKENDS)})")
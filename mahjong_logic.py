@@ -6,7 +6,10 @@
 
 from __future__ import annotations
 
-from collections.abc import Sequence
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Iterator, Sequence
 from copy import copy
 
 from mahjong.shanten import Shanten
@@ -28,6 +31,8 @@ class TaiwanShanten(Shanten):
     WINNING_TILES = 17  # 胡牌時手牌數 (5*3 + 2)
     TARGET_SETS = 5     # 面子目標數
 
+    _threshold: int | None = None  # shanten_below 的門檻 (None = 完整計算)
+
     def calculate_shanten_for_regular_hand(self, tiles_34: Sequence[int]) -> int:
         """
         計算台灣麻將一般型向聽數。
@@ -92,6 +97,43 @@ class TaiwanShanten(Shanten):
         """
         return self.calculate_shanten_for_regular_hand(tiles_34)
 
+    def shanten_below(self, tiles_34: Sequence[int], bound: int) -> bool:
+        """
+        門檻查詢: 向聽數是否 < bound。
+        結果與 calculate_shanten(tiles_34) < bound 完全相同，但只要找到一種
+        拆解達到門檻就立即停止，且會剪掉不可能低於門檻的分支。
+        """
+        self._threshold = bound
+        try:
+            return self.calculate_shanten_for_regular_hand(tiles_34) < bound
+        finally:
+            self._threshold = None
+
+    def _run(self, depth: int) -> None:
+        """
+        在原始遞迴搜尋外加上提早結束與剪枝:
+          - 門檻查詢時，已經低於門檻就不必再找
+          - 剩下的數牌每張最多讓向聽數再降 2/3 (3 張成一面子 = -2)，
+            若樂觀估計仍無法低於目前最佳值 (或門檻)，這個分支就不必展開
+        """
+        limit = self._min_shanten
+        if self._threshold is not None:
+            if limit < self._threshold:
+                return
+            limit = self._threshold
+
+        optimistic = (
+            self.TARGET_SETS * 2
+            - self._number_melds * 2
+            - self._number_tatsu
+            - self._number_pairs
+            - (2 * sum(self._tiles[depth:27])) // 3
+        )
+        if optimistic >= limit:
+            return
+
+        super()._run(depth)
+
 
 # ── 牌名轉換工具 ──────────────────────────────────────────────
 
@@ -166,6 +208,7 @@ def calculate_ukeire(
     tiles_34: list[int],
     shanten_calculator: TaiwanShanten,
     visible_tiles_34: list[int] | None = None,
+    table: TranspositionTable | None = None,
 ) -> dict:
     """
     計算有效進張 (Ukeire)。
@@ -175,9 +218,13 @@ def calculate_ukeire(
         tiles_34: 手牌的 34 陣列
         shanten_calculator: 向聽數計算器
         visible_tiles_34: 場上可見牌 (牌河/明牌) 的 34 陣列，用於扣除剩餘張數
+        table: 轉置表；有指定時先查表，查不到才計算並存入
 
     回傳: {tile_name: count, ...}  例如 {'3m': 3, '6p': 4}
     """
+    if table is not None:
+        return table.ukeire(tiles_34, shanten_calculator, visible_tiles_34)
+
     current_shanten = shanten_calculator.calculate_shanten(tiles_34)
 
     if current_shanten == Shanten.AGARI_STATE:
@@ -194,13 +241,13 @@ def calculate_ukeire(
         if known_count >= MAX_TILE_COUNT:
             continue
 
-        # 模擬摸到這張牌
+        # 模擬摸到這張牌，只需知道向聽數有沒有降低 (門檻查詢)
         tiles_34[idx] += 1
-        new_shanten = shanten_calculator.calculate_shanten(tiles_34)
+        improves = shanten_calculator.shanten_below(tiles_34, current_shanten)
         tiles_34[idx] -= 1
 
         # 如果向聽數降低了，就是有效進張
-        if new_shanten < current_shanten:
+        if improves:
             tile_name = index_to_tile_name(idx)
             remaining = MAX_TILE_COUNT - known_count
             ukeire[tile_name] = remaining
@@ -208,6 +255,139 @@ def calculate_ukeire(
     return ukeire
 
 
+# ── 對稱轉置表 (Transposition Table) ─────────────────────────
+# 純牌效計算 (向聽數 / 進張) 對下列變換不變:
+#   - 萬/筒/索 三種花色互換
+#   - 同一花色內 1↔9, 2↔8, ... 的鏡射 (每個花色可各自鏡射)
+#   - 七種字牌互換 (牌效計算不區分風牌與三元牌)
+# 因此把 (手牌, 可見牌) 轉成標準型後再查表，批次與模擬時命中率遠高於
+# 完全相同才命中的快取。查到的結果再依排列換回實際牌名。
+
+TRANSPOSITION_TABLE_SIZE = 100_000  # 預設最多保留的項目數
+
+
+def canonicalize_34(values: Sequence[int]) -> tuple[bytes, list[int]]:
+    """
+    將每種牌的特徵值 (長度 34) 轉為標準型。
+
+    回傳: (key, order)
+        key: 標準型 (可作為 dict key)
+        order: order[c] = 標準型第 c 個位置對應的實際 34 索引
+    """
+    suits = []
+    for base in (0, 9, 18):
+        seq = list(values[base:base + 9])
+        rev = seq[::-1]
+        if rev < seq:
+            suits.append((rev, list(range(base + 8, base - 1, -1))))
+        else:
+            suits.append((seq, list(range(base, base + 9))))
+    suits.sort(key=lambda suit: suit[0])
+
+    order = []
+    for _, indices in suits:
+        order.extend(indices)
+    order.extend(sorted(range(27, 34), key=lambda i: values[i]))
+
+    return bytes(values[i] for i in order), order
+
+
+class TranspositionTable:
+    """
+    以對稱標準型為 key 的向聽數 / 進張快取 (LRU，最多 maxsize 項)。
+
+    用法:
+        table = TranspositionTable()
+        calculate_decision(hand, visible, table=table)
+        table.stats()  # {'hits': ..., 'misses': ..., 'hitRate': ...}
+    """
+
+    def __init__(self, maxsize: int = TRANSPOSITION_TABLE_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, value) -> None:
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def shanten(self, tiles_34: list[int], shanten_calculator: TaiwanShanten) -> int:
+        """查表取得向聽數 (只與手牌有關)。"""
+        key, _ = canonicalize_34(tiles_34)
+        key = b's' + key
+
+        shanten = self._get(key)
+        if shanten is None:
+            shanten = shanten_calculator.calculate_shanten(tiles_34)
+            self._put(key, shanten)
+        return shanten
+
+    def ukeire(
+        self,
+        tiles_34: list[int],
+        shanten_calculator: TaiwanShanten,
+        visible_tiles_34: list[int] | None = None,
+    ) -> dict:
+        """
+        查表取得有效進張，格式與 calculate_ukeire 相同。
+        每種牌的特徵 = (手牌張數, 已知張數)，已知張數 >= 4 視為同一類。
+        """
+        features = []
+        for idx in range(34):
+            known = tiles_34[idx]
+            if visible_tiles_34:
+                known += visible_tiles_34[idx]
+            features.append(tiles_34[idx] * 5 + min(known, MAX_TILE_COUNT))
+        key, order = canonicalize_34(features)
+        key = b'u' + key
+
+        entry = self._get(key)
+        if entry is None:
+            ukeire = calculate_ukeire(tiles_34, shanten_calculator, visible_tiles_34)
+
+            # 以標準型位置存入
+            position = [0] * 34
+            for c, idx in enumerate(order):
+                position[idx] = c
+            self._put(key, tuple(
+                (position[tile_name_to_index(tile)], count)
+                for tile, count in ukeire.items()
+            ))
+            return ukeire
+
+        # 換回實際牌 (依 34 索引排序，與 calculate_ukeire 的輸出順序一致)
+        real = sorted((order[c], count) for c, count in entry)
+        return {index_to_tile_name(idx): count for idx, count in real}
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
 # ── 防守邏輯 (Genbutsu / Suji) ─────────────────────────────────
 
 # Suji (筋牌) 對照表
@@ -291,6 +471,28 @@ DANGER_PENALTY_MAP = {
 }
 
 
+def get_risk_factor(current_shanten: int) -> float:
+    """
+    動態風險係數 (防守懲罰的倍率)。
+    """
+    if current_shanten <= 0:
+        # 聽牌了！全攻模式 (Zentsu) — 不考慮防守
+        return 0.0
+    elif current_shanten == 1:
+        # 一向聽 — 標準模式
+        return 1.0
+    else:
+        # 二向聽以上 — 防禦模式 (Betaori) — 加倍防守
+        return 2.0
+
+
+def calculate_attack_score(candidate: dict) -> float:
+    """
+    進攻分數: 越低越好的 shanten 轉為越高越好的分數，再加上進張。
+    """
+    return -candidate['shanten'] * SHANTEN_WEIGHT + candidate['ukeire'] * UKEIRE_WEIGHT
+
+
 def calculate_final_score(
     candidate: dict,
     current_shanten: int,
@@ -303,34 +505,192 @@ def calculate_final_score(
       - 一向聽 (shanten == 1): 標準模式
       - 二向聽以上 (shanten >= 2): 防禦模式，懲罰加倍
     """
-    # ── 進攻分數: 越低越好的 shanten 轉為越高越好的分數
-    attack_score = -candidate['shanten'] * SHANTEN_WEIGHT + candidate['ukeire'] * UKEIRE_WEIGHT
+    # ── 進攻分數
+    attack_score = calculate_attack_score(candidate)
 
     # ── 防守懲罰
     safety_level = candidate.get('safety', {}).get('level', 2)
     base_penalty = DANGER_PENALTY_MAP.get(safety_level, 50.0)
 
-    # 動態風險係數
-    if current_shanten <= 0:
-        # 聽牌了！全攻模式 (Zentsu) — 不考慮防守
-        risk_factor = 0.0
-    elif current_shanten == 1:
-        # 一向聽 — 標準模式
-        risk_factor = 1.0
-    else:
-        # 二向聽以上 — 防禦模式 (Betaori) — 加倍防守
-        risk_factor = 2.0
-
-    defense_penalty = base_penalty * risk_factor
+    defense_penalty = base_penalty * get_risk_factor(current_shanten)
 
     return attack_score - defense_penalty
 
 
+def _discard_ukeire(
+    tiles_34: list[int],
+    tile: str,
+    shanten_calculator: TaiwanShanten,
+    visible_tiles_34: list[int] | None,
+    table: TranspositionTable | None = None,
+) -> dict:
+    """
+    計算打掉某張牌之後的有效進張。
+    """
+    idx = tile_name_to_index(tile)
+
+    # 模擬打掉這張牌 (打掉的牌加入可見牌)
+    tiles_34[idx] -= 1
+
+    # 打出的牌也變成「可見牌」
+    discard_visible = None
+    if visible_tiles_34 is not None:
+        discard_visible = list(visible_tiles_34)
+        discard_visible[idx] += 1
+
+    # 計算打掉後的進張
+    ukeire = calculate_ukeire(tiles_34, shanten_calculator, discard_visible, table)
+
+    # 還原
+    tiles_34[idx] += 1
+
+    return ukeire
+
+
+def _attack_candidate(
+    tile: str,
+    new_shanten: int,
+    current_shanten: int,
+    ukeire: dict,
+) -> dict:
+    """
+    組出候選打牌的進攻部分 (向聽數、進張、品質)，尚未考慮防守。
+    """
+    return {
+        'discard': tile,
+        'shanten': new_shanten,
+        'ukeire': sum(ukeire.values()),
+        'acceptingTiles': ukeire,
+        'quality': 'normal' if new_shanten <= current_shanten else 'receding',
+    }
+
+
+def _evaluate_discard(
+    tiles_34: list[int],
+    tile: str,
+    new_shanten: int,
+    current_shanten: int,
+    shanten_calculator: TaiwanShanten,
+    visible_tiles_34: list[int] | None,
+    table: TranspositionTable | None = None,
+    ukeire: dict | None = None,
+) -> dict:
+    """
+    計算單一候選打牌的進張、安全度與最終分數 (向聽數已事先算好)。
+    ukeire: 已算好的打掉後進張 (None = 在此計算)
+    """
+    if ukeire is None:
+        ukeire = _discard_ukeire(
+            tiles_34, tile, shanten_calculator, visible_tiles_34, table
+        )
+
+    candidate = _attack_candidate(tile, new_shanten, current_shanten, ukeire)
+
+    # 防守分析: 這張牌打出去安不安全？
+    candidate['safety'] = analyze_safety(tile, visible_tiles_34)
+
+    # 計算最終分數 (攻守結合)
+    candidate['finalScore'] = calculate_final_score(candidate, current_shanten)
+
+    return candidate
+
+
+def _discard_shanten_map(
+    tiles_34: list[int],
+    tiles_list: list[str],
+    current_shanten: int,
+    shanten_calculator: TaiwanShanten,
+    table: TranspositionTable | None = None,
+) -> dict[str, int]:
+    """
+    對手牌中每張不同的牌，計算打掉後的向聽數。
+    回傳: {tile_name: shanten, ...} (依 34 索引排序)
+    """
+    # 固定以牌的索引順序處理: 同分候選的先後 (以及 bestDiscard) 才不會
+    # 隨 set() 的雜湊順序 (PYTHONHASHSEED) 改變，模擬結果可重現
+    unique_tiles = sorted(set(tiles_list), key=tile_name_to_index)
+
+    # 打掉一張牌後向聽數通常等於 current_shanten 或 +1，
+    # 以門檻查詢由 current_shanten 往上確認，低於它時才做完整計算
+    discard_shanten = {}
+    for tile in unique_tiles:
+        idx = tile_name_to_index(tile)
+        tiles_34[idx] -= 1
+        if table is not None:
+            new_shanten = table.shanten(tiles_34, shanten_calculator)
+        elif shanten_calculator.shanten_below(tiles_34, current_shanten):
+            new_shanten = shanten_calculator.calculate_shanten(tiles_34)
+        else:
+            new_shanten = current_shanten
+            while not shanten_calculator.shanten_below(tiles_34, new_shanten + 1):
+                new_shanten += 1
+        discard_shanten[tile] = new_shanten
+        tiles_34[idx] += 1
+
+    return discard_shanten
+
+
+def _prune_discards(
+    discard_shanten: dict[str, int],
+    tiles_34: list[int],
+    current_shanten: int,
+    visible_tiles_34: list[int] | None,
+    top_k: int | None,
+) -> list[str]:
+    """
+    只憑向聽數估計每個候選的分數上下界，剔除不可能進入前 top_k 名的候選。
+
+    進張數介於 0 ~ 打掉後仍未見的牌數；防守懲罰介於 DANGER_PENALTY_MAP 的
+    最小 ~ 最大值 × 風險係數。若某候選的上界低於第 top_k 高的下界，
+    無論進張與安全度如何都不會排進前 top_k，就不必計算它的進張。
+    top_k 為 None 時不剔除，回傳所有候選。
+    """
+    if top_k is None:
+        return list(discard_shanten)
+
+    risk_factor = get_risk_factor(current_shanten)
+    penalties = [DANGER_PENALTY_MAP.get(level, 50.0) for level in (0, 1, 2)]
+    min_penalty = min(penalties) * risk_factor
+    max_penalty = max(penalties) * risk_factor
+
+    bounds = {}
+    for tile, new_shanten in discard_shanten.items():
+        idx = tile_name_to_index(tile)
+
+        # 打掉後仍未見的牌數 = 進張數的上限
+        unseen = 0
+        for i in range(34):
+            known = tiles_34[i] - (i == idx)
+            if visible_tiles_34 is not None:
+                known += visible_tiles_34[i] + (i == idx)
+            if known < MAX_TILE_COUNT:
+                unseen += MAX_TILE_COUNT - known
+
+        base = -new_shanten * SHANTEN_WEIGHT
+        ukeire_high = max(0.0, unseen * UKEIRE_WEIGHT)
+        ukeire_low = min(0.0, unseen * UKEIRE_WEIGHT)
+        bounds[tile] = (
+            base + ukeire_low - max_penalty,
+            base + ukeire_high - min_penalty,
+        )
+
+    if len(bounds) <= top_k:
+        return list(bounds)
+
+    # 第 top_k 高的下界: 至少有 top_k 個候選保證達到這個分數
+    threshold = sorted((low for low, _ in bounds.values()), reverse=True)[top_k - 1]
+
+    # 留一點浮點誤差空間，同分的候選保留 (排序結果與完整計算一致)
+    return [tile for tile, (_, high) in bounds.items() if high >= threshold - 1e-9]
+
+
 def calculate_discard_candidates(
     tiles_34: list[int],
     tiles_list: list[str],
     shanten_calculator: TaiwanShanten,
     visible_tiles_34: list[int] | None = None,
+    top_k: int | None = None,
+    table: TranspositionTable | None = None,
 ) -> list[dict]:
     """
     計算打牌建議 (Discard Candidates)。
@@ -338,6 +698,10 @@ def calculate_discard_candidates(
 
     參數:
         visible_tiles_34: 場上可見牌的 34 陣列 (用於精準計算剩餘張數)
+        top_k: 只需要前 k 名時指定。先算出每張打牌後的向聽數，剔除不可能
+            進入前 k 名的候選，只對剩下的候選計算進張與安全度；
+            回傳結果等同完整計算排序後的前 k 筆。None = 完整計算所有候選
+        table: 轉置表；向聽數與進張先查表 (見 TranspositionTable)
 
     回傳: 按 final_score 降序排列的候選列表
     [
@@ -353,55 +717,57 @@ def calculate_discard_candidates(
         ...
     ]
     """
-    current_shanten = shanten_calculator.calculate_shanten(tiles_34)
-
-    # 找出手牌中所有不同的牌
-    unique_tiles = set(tiles_list)
-    candidates = []
-
-    for tile in unique_tiles:
-        idx = tile_name_to_index(tile)
-
-        # 模擬打掉這張牌 (打掉的牌加入可見牌)
-        tiles_34[idx] -= 1
-
-        # 打出的牌也變成「可見牌」
-        discard_visible = None
-        if visible_tiles_34 is not None:
-            discard_visible = list(visible_tiles_34)
-            discard_visible[idx] += 1
-
-        new_shanten = shanten_calculator.calculate_shanten(tiles_34)
-
-        # 計算打掉後的進張
-        ukeire = calculate_ukeire(tiles_34, shanten_calculator, discard_visible)
-        total_ukeire = sum(ukeire.values())
-
-        # 還原
-        tiles_34[idx] += 1
-
-        quality = 'normal' if new_shanten <= current_shanten else 'receding'
+    if top_k is not None and top_k < 1:
+        raise ValueError(f"top_k 必須 >= 1: {top_k}")
 
-        # 防守分析: 這張牌打出去安不安全？
-        safety = analyze_safety(tile, visible_tiles_34)
-
-        candidate = {
-            'discard': tile,
-            'shanten': new_shanten,
-            'ukeire': total_ukeire,
-            'acceptingTiles': ukeire,
-            'quality': quality,
-            'safety': safety,
-        }
-
-        # 計算最終分數 (攻守結合)
-        candidate['finalScore'] = calculate_final_score(candidate, current_shanten)
-
-        candidates.append(candidate)
+    if table is not None:
+        current_shanten = table.shanten(tiles_34, shanten_calculator)
+    else:
+        current_shanten = shanten_calculator.calculate_shanten(tiles_34)
+
+    # 找出手牌中所有不同的牌，先算出每張打掉後的向聽數
+    discard_shanten = _discard_shanten_map(
+        tiles_34, tiles_list, current_shanten, shanten_calculator, table
+    )
+    survivors = _prune_discards(
+        discard_shanten, tiles_34, current_shanten, visible_tiles_34, top_k
+    )
+    return _rank_discards(
+        tiles_34, discard_shanten, survivors, current_shanten,
+        shanten_calculator, visible_tiles_34, table, top_k,
+    )
+
+
+def _rank_discards(
+    tiles_34: list[int],
+    discard_shanten: dict[str, int],
+    survivors: list[str],
+    current_shanten: int,
+    shanten_calculator: TaiwanShanten,
+    visible_tiles_34: list[int] | None,
+    table: TranspositionTable | None,
+    top_k: int | None,
+    ukeire_map: dict[str, dict] | None = None,
+) -> list[dict]:
+    """
+    計算 survivors 的完整候選 (進張 + 防守)，依 finalScore 降序排列並取前 top_k 名。
+    ukeire_map: 已算好的打掉後進張 {tile: ukeire} (沒有的在此計算)
+    """
+    candidates = [
+        _evaluate_discard(
+            tiles_34, tile, discard_shanten[tile], current_shanten,
+            shanten_calculator, visible_tiles_34, table,
+            ukeire_map.get(tile) if ukeire_map else None,
+        )
+        for tile in survivors
+    ]
 
     # 排序: final_score 降序 (分數越高越推薦)
     candidates.sort(key=lambda c: -c['finalScore'])
 
+    if top_k is not None:
+        candidates = candidates[:top_k]
+
     return candidates
 
 
@@ -410,6 +776,9 @@ def calculate_discard_candidates(
 def calculate_decision(
     tiles_list: list[str],
     visible_tiles: list[str] | None = None,
+    shanten_calculator: TaiwanShanten | None = None,
+    top_k: int | None = None,
+    table: TranspositionTable | None = None,
 ) -> dict | None:
     """
     計算牌效建議。取代 Node.js brain.js 的功能。
@@ -417,6 +786,9 @@ def calculate_decision(
     輸入:
         tiles_list: ['1m', '2m', '3m', ...]  (16 或 17 張手牌)
         visible_tiles: ['3z', '5m', ...] (場上可見的牌: 牌河、明牌等)
+        shanten_calculator: 可重複使用的向聽數計算器 (批次處理時避免每次重建)
+        top_k: 打牌階段只回傳前 k 名候選 (只需要最佳打牌時指定 1，計算量大幅減少)
+        table: 轉置表 (批次 / 模擬時跨手牌共用，命中時不必重算向聽數與進張)
     輸出: 計算結果 dict
 
     回傳範例 (17 張 / 打牌階段):
@@ -429,61 +801,363 @@ def calculate_decision(
         "visibleCount": 5
     }
     """
+    # 不限時跑完 iter_decision，最後階段就是完整結果
+    result = None
+    for result in iter_decision(
+        tiles_list, visible_tiles, None, shanten_calculator, top_k, table
+    ):
+        pass
+
+    result.pop('stage', None)
+    result.pop('complete', None)
+    return result
+
+
+# ── 漸進式決策 (Anytime) ──────────────────────────────────────
+# 分階段產生越來越精確的結果，畫面可以先顯示建議再逐步更新:
+#   1. 'shanten': 向聽數 + 暫定打牌 (只比較打掉後的向聽數)
+#   2. 'ukeire':  加上進張的完整排序 (只看進攻分數 attackScore)
+#   3. 'final':   加上防守調整 (calculate_decision 即為跑完此階段的結果)
+# 每個結果都帶 'stage' 與 'complete' (只有最後階段為 True)。
+# 指定 deadline_ms 時，時間一到就不再產生新的階段，以最後收到的結果為準；
+# 第 1 階段一定會完成 (它就是最低限度的答案)。
+
+def iter_decision(
+    tiles_list: list[str],
+    visible_tiles: list[str] | None = None,
+    deadline_ms: float | None = None,
+    shanten_calculator: TaiwanShanten | None = None,
+    top_k: int | None = None,
+    table: TranspositionTable | None = None,
+) -> Iterator[dict]:
+    """
+    分階段計算牌效建議 (generator)。參數與 calculate_decision 相同，另加:
+        deadline_ms: 時間預算 (毫秒，從呼叫開始計算)；None = 不限時
+
+    用法:
+        for result in iter_decision(hand, visible, deadline_ms=50):
+            show(result)   # result['stage'] = 'shanten' → 'ukeire' → 'final'
+    """
+    started = time.perf_counter()
+
+    def expired() -> bool:
+        return (
+            deadline_ms is not None
+            and (time.perf_counter() - started) * 1000 >= deadline_ms
+        )
+
     n = len(tiles_list)
     remainder = n % 3
 
     # 驗證牌數: 3n+1 (等待摸牌) 或 3n+2 (需要打牌)
     if remainder == 0:
-        return {
+        yield {
             'error': f'Invalid tile count: {n}. Must be 3n+1 (waiting) or 3n+2 (discarding).'
         }
+        return
 
     phase = 'waiting' if remainder == 1 else 'discarding'
 
     try:
+        if top_k is not None and top_k < 1:
+            raise ValueError(f"top_k 必須 >= 1: {top_k}")
+
         tiles_34 = tiles_list_to_34_array(tiles_list)
-        shanten_calc = TaiwanShanten()
-        shanten_num = shanten_calc.calculate_shanten(tiles_34)
+        shanten_calc = shanten_calculator or TaiwanShanten()
+        if table is not None:
+            shanten_num = table.shanten(tiles_34, shanten_calc)
+        else:
+            shanten_num = shanten_calc.calculate_shanten(tiles_34)
 
-        # 轉換場上可見牌為 34 陣列
         visible_34 = None
         if visible_tiles:
             visible_34 = tiles_list_to_34_array(visible_tiles)
 
-        output: dict = {
+        base = {
             'tileCount': n,
             'phase': phase,
             'shanten': shanten_num,
             'visibleCount': len(visible_tiles) if visible_tiles else 0,
         }
 
-        if phase == 'discarding':
-            # 打牌階段: 計算每張牌打掉後的效率
-            candidates = calculate_discard_candidates(
-                tiles_34, tiles_list, shanten_calc, visible_34
+        if phase == 'waiting':
+            # 等待摸牌階段: 向聽數 → 有效進張 (沒有防守階段)。
+            # 聽牌時「等哪些牌」就是最低限度的答案，不先輸出沒有進張的結果
+            if shanten_num != 0:
+                yield {**base, 'stage': 'shanten', 'complete': False}
+                if expired():
+                    return
+
+            ukeire = calculate_ukeire(tiles_34, shanten_calc, visible_34, table)
+            yield {
+                **base,
+                'acceptingTiles': ukeire,
+                'totalUkeire': sum(ukeire.values()),
+                'stage': 'final',
+                'complete': True,
+            }
+            return
+
+        # ── 第 1 階段: 只看打掉後的向聽數
+        discard_shanten = _discard_shanten_map(
+            tiles_34, tiles_list, shanten_num, shanten_calc, table
+        )
+        provisional = [
+            {
+                'discard': tile,
+                'shanten': new_shanten,
+                'quality': 'normal' if new_shanten <= shanten_num else 'receding',
+            }
+            for tile, new_shanten in sorted(discard_shanten.items(), key=lambda item: item[1])
+        ]
+        yield {
+            **base,
+            'candidates': provisional[:top_k] if top_k else provisional,
+            'bestDiscard': provisional[0]['discard'],
+            'stage': 'shanten',
+            'complete': False,
+        }
+
+        # ── 第 2 階段: 進張排序 (每算完一個候選就檢查時間)
+        survivors = _prune_discards(
+            discard_shanten, tiles_34, shanten_num, visible_34, top_k
+        )
+
+        ukeire_map = {}
+        for tile in survivors:
+            if expired():
+                return
+            ukeire_map[tile] = _discard_ukeire(
+                tiles_34, tile, shanten_calc, visible_34, table
             )
-            output['candidates'] = candidates
-            if candidates:
-                output['bestDiscard'] = candidates[0]['discard']
 
-        else:
-            # 等待摸牌階段: 計算有效進張
-            ukeire = calculate_ukeire(tiles_34, shanten_calc, visible_34)
-            output['acceptingTiles'] = ukeire
-            output['totalUkeire'] = sum(ukeire.values())
+        ranked = []
+        for tile in survivors:
+            candidate = _attack_candidate(
+                tile, discard_shanten[tile], shanten_num, ukeire_map[tile]
+            )
+            candidate['attackScore'] = calculate_attack_score(candidate)
+            ranked.append(candidate)
+        ranked.sort(key=lambda c: -c['attackScore'])
+
+        yield {
+            **base,
+            'candidates': ranked[:top_k] if top_k else ranked,
+            'bestDiscard': ranked[0]['discard'],
+            'stage': 'ukeire',
+            'complete': False,
+        }
+        if expired():
+            return
+
+        # ── 第 3 階段: 防守調整 (與 calculate_discard_candidates 共用 _rank_discards)
+        candidates = _rank_discards(
+            tiles_34, discard_shanten, survivors, shanten_num,
+            shanten_calc, visible_34, table, top_k, ukeire_map,
+        )
+
+        yield {
+            **base,
+            'candidates': candidates,
+            'bestDiscard': candidates[0]['discard'],
+            'stage': 'final',
+            'complete': True,
+        }
+
+    except Exception as e:
+        yield {'error': str(e)}
+
+
+def calculate_decision_anytime(
+    tiles_list: list[str],
+    visible_tiles: list[str] | None = None,
+    deadline_ms: float | None = None,
+    on_update=None,
+    shanten_calculator: TaiwanShanten | None = None,
+    top_k: int | None = None,
+    table: TranspositionTable | None = None,
+) -> dict | None:
+    """
+    在時間預算內計算牌效建議，回傳時間到時最好的結果。
+
+    參數:
+        deadline_ms: 時間預算 (毫秒)；None = 算到完整結果為止
+        on_update: 每完成一個階段就以該階段結果呼叫 on_update(result)
+
+    回傳: iter_decision 最後一個階段的結果，另加
+        'timedOut': True 表示時間到，結果並非最終階段
+    """
+    result = None
+    for result in iter_decision(
+        tiles_list, visible_tiles, deadline_ms, shanten_calculator, top_k, table
+    ):
+        if on_update is not None:
+            on_update(result)
+
+    if result is not None and 'error' not in result:
+        result['timedOut'] = not result['complete']
+    return result
+
+
+# ── 串流模式 (JSONL) ──────────────────────────────────────────
+# 每行一筆 JSON 輸入，每行輸出一筆 JSON 結果，可直接放進 Unix pipeline:
+#   cat hands.jsonl | python mahjong_logic.py --jsonl > results.jsonl
+#   python mahjong_logic.py --jsonl hands.jsonl --workers 4
+#
+# 接受的輸入格式 (每行擇一):
+#   ["1m", "2m", ...]                                  只有手牌
+#   "1m 2m 3m ..."                                     空白分隔的手牌字串
+#   {"hand": [...], "visible": [...], "id": "..."}     可附帶場上可見牌與 id
+# "hand" 也可寫成 "tiles"；"id" 會原樣帶到輸出 (含錯誤結果)，方便對應。
+# 輸出第 N 行永遠對應輸入第 N 行: 空白行或無法解析的行也會輸出 {"error": ...}。
+
+# 每個 process 共用一個計算器與轉置表 (worker 內也只建立一次)
+_stream_calculator: TaiwanShanten | None = None
+_stream_table: TranspositionTable | None = None
+
+# 多 worker 時每個 worker 最多同時排隊的行數 (讀取端只會領先這麼多行，記憶體有上限)
+STREAM_WINDOW_PER_WORKER = 4
+
 
-        return output
+def _parse_request_data(data) -> tuple[list[str], list[str] | None]:
+    """從已解析的 JSON 取出 (tiles_list, visible_tiles)。"""
+    visible = None
+    if isinstance(data, dict):
+        visible = data.get('visible')
+        data = data.get('hand', data.get('tiles'))
 
+    if isinstance(data, str):
+        data = data.split()
+    if isinstance(visible, str):
+        visible = visible.split()
+
+    if not isinstance(data, list):
+        raise ValueError("缺少手牌: 需要 JSON 陣列、字串或含 'hand' 的物件")
+
+    return data, visible or None
+
+
+def decide_jsonl_line(line: str) -> str:
+    """
+    計算一行 JSONL 輸入並回傳一行 JSON 結果 (不含換行)。
+    空白行或解析失敗時回傳 {"error": ...}，不會中斷整個串流；
+    只要 JSON 本身可解析，錯誤結果也會帶上 "id"。
+    """
+    global _stream_calculator, _stream_table
+    if _stream_calculator is None:
+        _stream_calculator = TaiwanShanten()
+        _stream_table = TranspositionTable()
+
+    request_id = None
+    try:
+        if not line.strip():
+            raise ValueError("空白行")
+        data = json.loads(line)
+        if isinstance(data, dict):
+            request_id = data.get('id')
+        tiles_list, visible = _parse_request_data(data)
+        result = calculate_decision(
+            tiles_list, visible, _stream_calculator, table=_stream_table
+        )
     except Exception as e:
-        return {'error': str(e)}
+        result = {'error': str(e)}
+
+    if request_id is not None:
+        result = {'id': request_id, **result}
+
+    return json.dumps(result, ensure_ascii=False, separators=(',', ':'))
+
+
+def stream_jsonl(lines, out, workers: int = 1) -> int:
+    """
+    逐行處理 JSONL 並寫到 out，每寫一行就 flush。
+
+    參數:
+        lines: 可迭代的輸入行 (檔案物件或 sys.stdin)
+        out: 輸出串流
+        workers: > 1 時分散到多個 worker process，輸出順序仍與輸入相同。
+            最多只會先讀取 workers × STREAM_WINDOW_PER_WORKER 行，
+            每行算完 (且前面的行都已輸出) 就立即輸出，不必等下一行輸入
+
+    回傳: 處理的筆數 (等於輸入行數)
+    """
+    if workers > 1:
+        return _stream_jsonl_parallel(lines, out, workers)
+
+    count = 0
+    for line in lines:
+        out.write(decide_jsonl_line(line) + '\n')
+        out.flush()
+        count += 1
+    return count
+
+
+def _stream_jsonl_parallel(lines, out, workers: int) -> int:
+    """
+    stream_jsonl 的多 worker 版本。
+    主執行緒讀取輸入並送進 pool (每行一個工作)；輸出執行緒依輸入順序等待
+    結果並寫出。兩者之間是有上限的佇列，佇列滿時讀取端會暫停。
+    """
+    import multiprocessing
+    import queue
+    import threading
+
+    pending: queue.Queue = queue.Queue(maxsize=workers * STREAM_WINDOW_PER_WORKER)
+    state = {'count': 0, 'error': None}
+
+    def write_results() -> None:
+        while True:
+            result = pending.get()
+            if result is None:
+                return
+            if state['error'] is not None:
+                continue  # 輸出已失敗: 只清空佇列，讓讀取端不會卡住
+            try:
+                out.write(result.get() + '\n')
+                out.flush()
+                state['count'] += 1
+            except Exception as e:
+                state['error'] = e
+
+    with multiprocessing.Pool(workers) as pool:
+        writer = threading.Thread(target=write_results, daemon=True)
+        writer.start()
+        try:
+            for line in lines:
+                if state['error'] is not None:
+                    break
+                pending.put(pool.apply_async(decide_jsonl_line, (line,)))
+        finally:
+            pending.put(None)
+            writer.join()
+
+    if state['error'] is not None:
+        raise state['error']
+    return state['count']
 
 
 # ── 獨立測試 ──────────────────────────────────────────────────
 if __name__ == '__main__':
-    import json
+    import argparse
     import sys
 
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] == '--jsonl':
+        # 用法: python mahjong_logic.py --jsonl [檔案|-] [--workers N]
+        parser = argparse.ArgumentParser(
+            prog='mahjong_logic.py --jsonl',
+            description="JSONL 串流模式: 每行一筆手牌，每行輸出一筆結果",
+        )
+        parser.add_argument('input', nargs='?', default='-', help="輸入檔 (- = stdin)")
+        parser.add_argument('--workers', type=int, default=1, help="worker process 數")
+        args = parser.parse_args(sys.argv[2:])
+
+        if args.input != '-':
+            with open(args.input, encoding='utf-8') as f:
+                stream_jsonl(f, sys.stdout, args.workers)
+        else:
+            stream_jsonl(sys.stdin, sys.stdout, args.workers)
+
+    elif len(sys.argv) > 1:
         input_str = " ".join(sys.argv[1:])
         input_str = input_str.replace('"', '').replace("'", "")
         hand = input_str.split()
@@ -0,0 +1,247 @@
+# 檔案: regression_check.py
+# 用途: 牌效引擎與自我對戰模擬器的回歸檢查 (不需要攝影機或模型)
+# 執行: python regression_check.py
+#
+# 每項檢查失敗時會印出原因，全部通過則結束碼為 0。
+
+import json
+import os
+import random
+import subprocess
+import sys
+
+from mahjong.shanten import Shanten
+
+from mahjong_logic import (
+    MAX_TILE_COUNT,
+    TaiwanShanten,
+    TranspositionTable,
+    calculate_decision,
+    calculate_discard_candidates,
+    calculate_ukeire,
+    index_to_tile_name,
+    tiles_list_to_34_array,
+)
+
+# 報表中與執行速度有關、每次都會不同的欄位
+TIMING_KEYS = ('elapsedSec', 'gamesPerMinute', 'latencyMs')
+
+
+class ReferenceShanten(TaiwanShanten):
+    """不剪枝、不提早結束的完整搜尋 (原始 Shanten._run)，作為比對基準。"""
+
+    def _run(self, depth: int) -> None:
+        Shanten._run(self, depth)
+
+
+def _random_hands(count: int, seed: int) -> list[list[int]]:
+    """
+    產生隨機手牌 (34 陣列)，包含 13/14/16/17 張的一般手牌與
+    集中在單一花色的清一色型手牌 (最容易觸發剪枝)。
+    """
+    rng = random.Random(seed)
+    wall = [idx for idx in range(34) for _ in range(MAX_TILE_COUNT)]
+    hands = []
+    for i in range(count):
+        size = rng.choice((13, 14, 16, 17))
+        if i % 4 == 3:
+            suit = rng.randrange(3) * 9
+            pool = [idx for idx in wall if suit <= idx < suit + 9 or idx >= 27]
+        else:
+            pool = wall
+        tiles_34 = [0] * 34
+        for idx in rng.sample(pool, size):
+            tiles_34[idx] += 1
+        hands.append(tiles_34)
+    return hands
+
+
+def _reference_ukeire(tiles_34: list[int], reference: ReferenceShanten) -> dict:
+    """以完整向聽數逐張比較的進張 (calculate_ukeire 的比對基準)。"""
+    current = reference.calculate_shanten(tiles_34)
+    if current == Shanten.AGARI_STATE:
+        return {}
+    ukeire = {}
+    for idx in range(34):
+        if tiles_34[idx] >= MAX_TILE_COUNT:
+            continue
+        tiles_34[idx] += 1
+        if reference.calculate_shanten(tiles_34) < current:
+            ukeire[index_to_tile_name(idx)] = MAX_TILE_COUNT - tiles_34[idx] + 1
+        tiles_34[idx] -= 1
+    return ukeire
+
+
+def check_shanten_pruning(hands: int = 400, seed: int = 30) -> list[str]:
+    """
+    剪枝後的向聽數、每個門檻的 shanten_below 與進張，
+    都必須與不剪枝的完整搜尋一致。
+    """
+    calc = TaiwanShanten()
+    reference = ReferenceShanten()
+    errors = []
+    for tiles_34 in _random_hands(hands, seed):
+        expected = reference.calculate_shanten(tiles_34)
+        actual = calc.calculate_shanten(tiles_34)
+        if actual != expected:
+            errors.append(f"shanten: {tiles_34} → {actual}，應為 {expected}")
+            continue
+
+        for bound in range(-1, TaiwanShanten.TARGET_SETS * 2 + 2):
+            if calc.shanten_below(tiles_34, bound) != (expected < bound):
+                errors.append(f"shanten_below: {tiles_34} bound={bound}，向聽 {expected}")
+
+        if sum(tiles_34) >= TaiwanShanten.WINNING_TILES:
+            continue  # 已是摸牌後的張數，不再計算進張
+        expected_ukeire = _reference_ukeire(tiles_34, reference)
+        actual_ukeire = calculate_ukeire(tiles_34, calc)
+        if actual_ukeire != expected_ukeire:
+            errors.append(f"ukeire: {tiles_34} → {actual_ukeire}，應為 {expected_ukeire}")
+    return errors
+
+
+def _tile_names(tiles_34: list[int]) -> list[str]:
+    return [index_to_tile_name(idx) for idx in range(34) for _ in range(tiles_34[idx])]
+
+
+def _symmetric_variant(rng: random.Random):
+    """
+    產生一個隨機的對稱變換 (花色互換 + 各花色鏡射 + 字牌互換)，
+    回傳套用到牌名列表的函式。
+    """
+    suits = ['m', 'p', 's']
+    rng.shuffle(suits)
+    suit_map = dict(zip('mps', suits))
+    mirror = {suit: rng.random() < 0.5 for suit in 'mps'}
+    honors = list(range(1, 8))
+    rng.shuffle(honors)
+
+    def transform(names: list[str]) -> list[str]:
+        result = []
+        for name in names:
+            number, suit = int(name[0]), name[1]
+            if suit == 'z':
+                result.append(f"{honors[number - 1]}z")
+            else:
+                if mirror[suit]:
+                    number = 10 - number
+                result.append(f"{number}{suit_map[suit]}")
+        return result
+
+    return transform
+
+
+def check_transposition_table(hands: int = 150, seed: int = 31) -> list[str]:
+    """
+    轉置表的結果必須與不查表完全相同；對稱變換後的手牌 (花色互換、
+    鏡射、字牌互換) 必須全部命中原手牌存入的項目。
+    """
+    rng = random.Random(seed)
+    calc = TaiwanShanten()
+    errors = []
+    for tiles_34 in _random_hands(hands, seed):
+        tiles = _tile_names(tiles_34)
+        rest = [
+            index_to_tile_name(idx)
+            for idx in range(34) for _ in range(MAX_TILE_COUNT - tiles_34[idx])
+        ]
+        visible = rng.sample(rest, rng.randint(0, 30)) or None
+
+        table = TranspositionTable()
+        if calculate_decision(tiles, visible, calc, table=table) != calculate_decision(tiles, visible, calc):
+            errors.append(f"table: {tiles} visible={visible} 與不查表結果不同")
+            continue
+
+        transform = _symmetric_variant(rng)
+        variant = transform(tiles)
+        variant_visible = transform(visible) if visible else None
+        misses = table.misses
+        cached = calculate_decision(variant, variant_visible, calc, table=table)
+        if table.misses != misses:
+            errors.append(f"table: 對稱手牌 {variant} 未命中 ({table.misses - misses} 次)")
+        if cached != calculate_decision(variant, variant_visible, calc):
+            errors.append(f"table: 對稱手牌 {variant} visible={variant_visible} 結果不同")
+    return errors
+
+
+def check_top_k(hands: int = 150, seed: int = 29) -> list[str]:
+    """
+    top_k=k 的候選必須等於完整排序的前 k 筆 (k = 1, 2, 3, 5 與全部)；
+    calculate_discard_candidates 也必須與 calculate_decision 的候選相同。
+    """
+    rng = random.Random(seed)
+    calc = TaiwanShanten()
+    wall = [index_to_tile_name(idx) for idx in range(34) for _ in range(MAX_TILE_COUNT)]
+    errors = []
+    for _ in range(hands):
+        rng.shuffle(wall)
+        size = rng.choice((14, 17))
+        tiles = wall[:size]
+        visible = wall[size:size + rng.randint(0, 30)] or None
+
+        full = calculate_decision(tiles, visible, calc)['candidates']
+        for k in sorted({1, 2, 3, 5, len(full)}):
+            pruned = calculate_decision(tiles, visible, calc, top_k=k)['candidates']
+            if pruned != full[:k]:
+                errors.append(f"top_k={k}: {tiles} visible={visible} 與完整排序前 {k} 名不同")
+
+            direct = calculate_discard_candidates(
+                tiles_list_to_34_array(tiles), tiles, calc,
+                tiles_list_to_34_array(visible) if visible else None, top_k=k,
+            )
+            if direct != pruned:
+                errors.append(f"calculate_discard_candidates top_k={k}: {tiles} 與 calculate_decision 不同")
+    return errors
+
+
+def _strip_timing(value):
+    if isinstance(value, dict):
+        return {k: _strip_timing(v) for k, v in value.items() if k not in TIMING_KEYS}
+    if isinstance(value, list):
+        return [_strip_timing(v) for v in value]
+    return value
+
+
+def check_arena_determinism(games: int = 8, seed: int = 7) -> list[str]:
+    """
+    同樣的 seed 跑兩次自我對戰 (不同 PYTHONHASHSEED)，報表必須完全相同。
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    reports = []
+    for hash_seed in ('1', '2'):
+        env = dict(os.environ, PYTHONHASHSEED=hash_seed)
+        output = subprocess.run(
+            [sys.executable, os.path.join(here, 'selfplay_arena.py'),
+             '--games', str(games), '--workers', '1', '--seed', str(seed), '--json'],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        reports.append(_strip_timing(json.loads(output)))
+
+    if reports[0] != reports[1]:
+        return [f"arena: seed={seed} 兩次結果不同:\n  {reports[0]}\n  {reports[1]}"]
+    return []
+
+
+CHECKS = [
+    check_shanten_pruning,
+    check_transposition_table,
+    check_top_k,
+    check_arena_determinism,
+]
+
+
+def main() -> int:
+    failures = []
+    for check in CHECKS:
+        errors = check()
+        status = "OK" if not errors else f"FAIL ({len(errors)})"
+        print(f"[{status}] {check.__name__}")
+        failures.extend(errors)
+
+    for error in failures[:20]:
+        print(f"  - {error}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
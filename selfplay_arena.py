@@ -0,0 +1,424 @@
+# 檔案: selfplay_arena.py
+# 台灣麻將 (16 張) 四人自我對戰模擬器 — 用於調整攻守權重
+# ──────────────────────────────────────────────────────────────
+# 每個座位都由 mahjong_logic.calculate_decision 決定打牌，
+# 以多個 worker process 平行跑大量對局，並統計每組權重設定的
+# 胡牌率、放槍率、平均巡數與每次決策的引擎延遲。
+#
+# 規則簡化 (引擎本身只處理門清牌效):
+#   - 不含花牌、不吃不碰不槓，只有自摸與放槍 (胡別家打出的牌)
+#   - 一炮多響時，依打牌者下家起算的順序只有第一家胡
+#   - 牌山剩 DEAD_WALL_SIZE 張時流局
+#
+# 用法:
+#   python selfplay_arena.py --games 2000 --workers 8 --seed 42
+#   python selfplay_arena.py --configs my_weights.json --json
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from mahjong.shanten import Shanten
+
+import mahjong_logic
+from mahjong_logic import (
+    MAX_TILE_COUNT,
+    TaiwanShanten,
+    TranspositionTable,
+    calculate_decision,
+    index_to_tile_name,
+    tile_name_to_index,
+)
+
+
+# ── 對局參數 ──────────────────────────────────────────────────
+
+NUM_PLAYERS = 4
+HAND_SIZE = 16          # 台灣麻將手牌張數 (摸牌後 17 張)
+DEAD_WALL_SIZE = 16     # 留牌 (海底) 張數，剩這麼多張就流局
+
+# 每個 worker 一次處理的對局數 (太小 → 排程開銷大；太大 → 負載不均)
+GAMES_PER_TASK = 25
+
+# 預設比較的權重設定
+# 格式: {'name', 'shanten_weight', 'ukeire_weight', 'danger_penalty_map'}
+DEFAULT_CONFIGS = [
+    {
+        'name': 'baseline',
+        'shanten_weight': mahjong_logic.SHANTEN_WEIGHT,
+        'ukeire_weight': mahjong_logic.UKEIRE_WEIGHT,
+        'danger_penalty_map': dict(mahjong_logic.DANGER_PENALTY_MAP),
+    },
+    {
+        'name': 'full-attack',
+        'shanten_weight': mahjong_logic.SHANTEN_WEIGHT,
+        'ukeire_weight': mahjong_logic.UKEIRE_WEIGHT,
+        'danger_penalty_map': {0: 0.0, 1: 0.0, 2: 0.0},
+    },
+    {
+        'name': 'cautious',
+        'shanten_weight': mahjong_logic.SHANTEN_WEIGHT,
+        'ukeire_weight': mahjong_logic.UKEIRE_WEIGHT,
+        'danger_penalty_map': {0: 0.0, 1: 40.0, 2: 200.0},
+    },
+]
+
+
+# ── 權重切換 ──────────────────────────────────────────────────
+
+@contextmanager
+def apply_weights(config: dict):
+    """
+    暫時把 mahjong_logic 的模組層級權重換成 config 的值。
+    calculate_final_score 每次呼叫都讀取模組變數，所以換完立即生效。
+    """
+    saved = (
+        mahjong_logic.SHANTEN_WEIGHT,
+        mahjong_logic.UKEIRE_WEIGHT,
+        mahjong_logic.DANGER_PENALTY_MAP,
+    )
+    mahjong_logic.SHANTEN_WEIGHT = float(config['shanten_weight'])
+    mahjong_logic.UKEIRE_WEIGHT = float(config['ukeire_weight'])
+    # JSON 讀進來的 key 是字串，統一轉回 int
+    mahjong_logic.DANGER_PENALTY_MAP = {
+        int(level): float(penalty)
+        for level, penalty in config['danger_penalty_map'].items()
+    }
+    try:
+        yield
+    finally:
+        (
+            mahjong_logic.SHANTEN_WEIGHT,
+            mahjong_logic.UKEIRE_WEIGHT,
+            mahjong_logic.DANGER_PENALTY_MAP,
+        ) = saved
+
+
+# ── 單局模擬 ──────────────────────────────────────────────────
+
+def build_wall(seed: int, game_index: int) -> list[int]:
+    """
+    產生洗好的牌山 (34 陣列索引的列表，共 136 張)。
+    同樣的 (seed, game_index) 一定得到同樣的牌山。
+    """
+    wall = [idx for idx in range(34) for _ in range(MAX_TILE_COUNT)]
+    random.Random(f"{seed}:{game_index}").shuffle(wall)
+    return wall
+
+
+def _hand_to_list(hand_34: list[int]) -> list[str]:
+    """34 陣列 → 牌名列表 (calculate_decision 的輸入格式)。"""
+    tiles = []
+    for idx, count in enumerate(hand_34):
+        tiles.extend([index_to_tile_name(idx)] * count)
+    return tiles
+
+
+def _is_winning(hand_34: list[int], shanten_calc: TaiwanShanten) -> bool:
+    return shanten_calc.calculate_shanten(hand_34) == Shanten.AGARI_STATE
+
+
+def play_game(
+    seed: int,
+    game_index: int,
+    seat_configs: list[dict],
+    shanten_calc: TaiwanShanten,
+    table: TranspositionTable | None = None,
+) -> dict:
+    """
+    模擬一局。莊家固定為 0 號座位，由莊家先摸第 17 張。
+
+    回傳:
+    {
+        'winner': 2 | None,          # None = 流局
+        'dealInSeat': 0 | None,      # 放槍者 (自摸或流局為 None)
+        'selfDrawn': True | False,
+        'turns': [5, 5, 4, 4],       # 每個座位摸牌次數
+        'latencies': [[...], ...],   # 每個座位每次決策的耗時 (秒)
+    }
+    """
+    wall = build_wall(seed, game_index)
+    pos = 0
+
+    hands = [[0] * 34 for _ in range(NUM_PLAYERS)]
+    for seat in range(NUM_PLAYERS):
+        for idx in wall[pos:pos + HAND_SIZE]:
+            hands[seat][idx] += 1
+        pos += HAND_SIZE
+
+    river: list[str] = []
+    turns = [0] * NUM_PLAYERS
+    latencies: list[list[float]] = [[] for _ in range(NUM_PLAYERS)]
+    result = {
+        'winner': None,
+        'dealInSeat': None,
+        'selfDrawn': False,
+        'turns': turns,
+        'latencies': latencies,
+    }
+
+    seat = 0
+    while len(wall) - pos > DEAD_WALL_SIZE:
+        # ── 1. 摸牌
+        hand = hands[seat]
+        hand[wall[pos]] += 1
+        pos += 1
+        turns[seat] += 1
+
+        # ── 2. 自摸
+        if _is_winning(hand, shanten_calc):
+            result['winner'] = seat
+            result['selfDrawn'] = True
+            return result
+
+        # ── 3. 由引擎決定打哪張 (只需要最佳打牌 → top_k=1)
+        with apply_weights(seat_configs[seat]):
+            start = time.perf_counter()
+            decision = calculate_decision(
+                _hand_to_list(hand), river or None, shanten_calc,
+                top_k=1, table=table,
+            )
+            latencies[seat].append(time.perf_counter() - start)
+
+        if 'error' in decision:
+            raise RuntimeError(f"引擎錯誤 (seat {seat}): {decision['error']}")
+
+        discard = decision['bestDiscard']
+        discard_idx = tile_name_to_index(discard)
+        hand[discard_idx] -= 1
+        river.append(discard)
+
+        # ── 4. 其他家是否胡這張 (下家優先)
+        for offset in range(1, NUM_PLAYERS):
+            other = (seat + offset) % NUM_PLAYERS
+            hands[other][discard_idx] += 1
+            won = _is_winning(hands[other], shanten_calc)
+            hands[other][discard_idx] -= 1
+            if won:
+                result['winner'] = other
+                result['dealInSeat'] = seat
+                return result
+
+        seat = (seat + 1) % NUM_PLAYERS
+
+    return result
+
+
+def seat_configs_for_game(configs: list[dict], game_index: int) -> list[int]:
+    """
+    輪替每局的座位分配，讓每組設定平均坐到莊家與各個位置。
+    回傳每個座位使用的 config 索引。
+    """
+    return [(game_index + seat) % len(configs) for seat in range(NUM_PLAYERS)]
+
+
+def _new_stats(num_configs: int) -> dict:
+    return {
+        'games': 0,
+        'draws': 0,
+        'totalTurns': 0,
+        'tableHits': 0,
+        'tableMisses': 0,
+        'seats': [0] * num_configs,
+        'wins': [0] * num_configs,
+        'selfDrawn': [0] * num_configs,
+        'dealIns': [0] * num_configs,
+        'turns': [0] * num_configs,
+        'latencies': [[] for _ in range(num_configs)],
+    }
+
+
+def run_games(seed: int, start: int, stop: int, configs: list[dict]) -> dict:
+    """
+    在目前 process 中跑第 start ~ stop-1 局，回傳累計統計。
+    (worker process 的進入點)
+    """
+    shanten_calc = TaiwanShanten()
+    table = TranspositionTable()
+    stats = _new_stats(len(configs))
+
+    for game_index in range(start, stop):
+        assignment = seat_configs_for_game(configs, game_index)
+        game = play_game(
+            seed, game_index, [configs[i] for i in assignment], shanten_calc, table
+        )
+
+        stats['games'] += 1
+        stats['totalTurns'] += sum(game['turns'])
+        if game['winner'] is None:
+            stats['draws'] += 1
+
+        for seat, config_idx in enumerate(assignment):
+            stats['seats'][config_idx] += 1
+            stats['turns'][config_idx] += game['turns'][seat]
+            stats['latencies'][config_idx].extend(game['latencies'][seat])
+            if game['winner'] == seat:
+                stats['wins'][config_idx] += 1
+                if game['selfDrawn']:
+                    stats['selfDrawn'][config_idx] += 1
+            if game['dealInSeat'] == seat:
+                stats['dealIns'][config_idx] += 1
+
+    table_stats = table.stats()
+    stats['tableHits'] = table_stats['hits']
+    stats['tableMisses'] = table_stats['misses']
+    return stats
+
+
+def _merge_stats(total: dict, part: dict) -> None:
+    for key in ('games', 'draws', 'totalTurns', 'tableHits', 'tableMisses'):
+        total[key] += part[key]
+    for key in ('seats', 'wins', 'selfDrawn', 'dealIns', 'turns'):
+        for i, value in enumerate(part[key]):
+            total[key][i] += value
+    for i, samples in enumerate(part['latencies']):
+        total['latencies'][i].extend(samples)
+
+
+def _percentile(sorted_samples: list[float], pct: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    k = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[k]
+
+
+def summarize(stats: dict, configs: list[dict], elapsed: float) -> dict:
+    """
+    將累計統計整理為報表。
+
+    回傳:
+    {
+        'games': 2000, 'draws': 310, 'elapsedSec': 41.2, 'gamesPerMinute': 2912.6,
+        'avgTurnsPerGame': 52.3, 'tableHitRate': 0.41,
+        'configs': [
+            {'name': 'baseline', 'seats': 2667, 'winRate': 0.21, 'selfDrawnRate': 0.08,
+             'dealInRate': 0.13, 'avgTurns': 13.1,
+             'latencyMs': {'mean': 9.8, 'p50': 8.7, 'p95': 19.5, 'max': 61.0}},
+            ...
+        ]
+    }
+    """
+    games = stats['games']
+    lookups = stats['tableHits'] + stats['tableMisses']
+    report = {
+        'games': games,
+        'draws': stats['draws'],
+        'elapsedSec': round(elapsed, 2),
+        'gamesPerMinute': round(games / elapsed * 60, 1) if elapsed > 0 else 0.0,
+        'avgTurnsPerGame': round(stats['totalTurns'] / games, 2) if games else 0.0,
+        'tableHitRate': round(stats['tableHits'] / lookups, 4) if lookups else 0.0,
+        'configs': [],
+    }
+
+    for i, config in enumerate(configs):
+        seats = stats['seats'][i]
+        samples = sorted(stats['latencies'][i])
+        report['configs'].append({
+            'name': config['name'],
+            'seats': seats,
+            'winRate': round(stats['wins'][i] / seats, 4) if seats else 0.0,
+            'selfDrawnRate': round(stats['selfDrawn'][i] / seats, 4) if seats else 0.0,
+            'dealInRate': round(stats['dealIns'][i] / seats, 4) if seats else 0.0,
+            'avgTurns': round(stats['turns'][i] / seats, 2) if seats else 0.0,
+            'latencyMs': {
+                'mean': round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+                'p50': round(_percentile(samples, 50) * 1000, 3),
+                'p95': round(_percentile(samples, 95) * 1000, 3),
+                'max': round(samples[-1] * 1000, 3) if samples else 0.0,
+            },
+        })
+
+    return report
+
+
+def run_arena(
+    num_games: int,
+    configs: list[dict] | None = None,
+    seed: int = 0,
+    workers: int | None = None,
+) -> dict:
+    """
+    跑 num_games 局自我對戰並回傳 summarize() 的報表。
+
+    參數:
+        configs: 權重設定列表 (預設 DEFAULT_CONFIGS)
+        seed: 牌山亂數種子，同樣的 seed + 局數 → 同樣的牌山
+        workers: worker process 數 (預設 os.cpu_count())；1 = 在目前 process 執行
+    """
+    configs = configs or DEFAULT_CONFIGS
+    workers = workers or os.cpu_count() or 1
+
+    chunks = [
+        (start, min(start + GAMES_PER_TASK, num_games))
+        for start in range(0, num_games, GAMES_PER_TASK)
+    ]
+    total = _new_stats(len(configs))
+
+    started = time.perf_counter()
+    if workers == 1:
+        for start, stop in chunks:
+            _merge_stats(total, run_games(seed, start, stop, configs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(run_games, seed, start, stop, configs)
+                for start, stop in chunks
+            ]
+            for future in futures:
+                _merge_stats(total, future.result())
+    elapsed = time.perf_counter() - started
+
+    return summarize(total, configs, elapsed)
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"對局: {report['games']} (流局 {report['draws']}), "
+        f"耗時 {report['elapsedSec']}s, {report['gamesPerMinute']} 局/分鐘, "
+        f"平均每局 {report['avgTurnsPerGame']} 巡, "
+        f"轉置表命中率 {report['tableHitRate'] * 100:.1f}%",
+        "",
+        f"{'config':<16}{'seats':>7}{'win%':>8}{'tsumo%':>8}{'dealIn%':>9}"
+        f"{'turns':>7}{'mean ms':>9}{'p95 ms':>9}{'max ms':>9}",
+    ]
+    for c in report['configs']:
+        lat = c['latencyMs']
+        lines.append(
+            f"{c['name']:<16}{c['seats']:>7}{c['winRate'] * 100:>8.2f}"
+            f"{c['selfDrawnRate'] * 100:>8.2f}{c['dealInRate'] * 100:>9.2f}"
+            f"{c['avgTurns']:>7.2f}{lat['mean']:>9.2f}{lat['p95']:>9.2f}{lat['max']:>9.2f}"
+        )
+    return "\n".join(lines)
+
+
+# ── 命令列入口 ────────────────────────────────────────────────
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="台灣麻將 16 張自我對戰權重評估")
+    parser.add_argument('--games', type=int, default=200, help="對局數")
+    parser.add_argument('--workers', type=int, default=None, help="worker process 數")
+    parser.add_argument('--seed', type=int, default=0, help="牌山亂數種子")
+    parser.add_argument(
+        '--configs',
+        help="權重設定 JSON 檔 (list of {name, shanten_weight, ukeire_weight, danger_penalty_map})",
+    )
+    parser.add_argument('--json', action='store_true', help="以 JSON 輸出報表")
+    args = parser.parse_args()
+
+    configs = None
+    if args.configs:
+        with open(args.configs, encoding='utf-8') as f:
+            configs = json.load(f)
+
+    report = run_arena(args.games, configs, seed=args.seed, workers=args.workers)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
@@ -1,30 +1,73 @@
 # 檔案: test_camera.py
 # 用途: 開啟攝影機並測試 YOLO + 牌效計算
-# 執行: python test_camera.py
+# 執行: python test_camera.py [模型路徑] [--threads N]
+#   python test_camera.py              → PyTorch best.pt (ultralytics)
+#   python test_camera.py best.onnx    → ONNX Runtime (CPU 最佳化)
 
+import argparse
 import cv2
 import time
 import sys
 
 # 嘗試匯入必要的庫
 try:
-    from ultralytics import YOLO
     import vision_bridge
+    from detectors import load_detector
 except ImportError as e:
     print(f"[Error] Missing dependency: {e}")
     print("Please install required packages:")
     print("pip install ultralytics opencv-python")
     sys.exit(1)
 
+# 每次計算建議的時間預算 (毫秒)；先顯示暫定建議，時間內逐步更新
+DECISION_DEADLINE_MS = 200
+
+
+def draw_detections(frame, detections):
+    """在畫面上畫出偵測框與牌名 (所有後端共用)。"""
+    annotated = frame.copy()
+    for det in detections:
+        x1, y1, x2, y2 = (int(v) for v in det.xyxy)
+        label = f"{vision_bridge.YOLO_MAP.get(det.cls, det.cls)} {det.conf:.2f}"
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(annotated, label, (x1, max(y1 - 5, 10)),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    return annotated
+
+
+def show_frame(frame, detections, advice: str) -> None:
+    """畫出偵測框與建議文字並顯示。"""
+    annotated_frame = draw_detections(frame, detections)
+
+    # 畫上建議文字 (注意: cv2.putText 不支援中文，這裡顯示 ASCII 或簡單資訊)
+    # 如果需要中文，需使用 PIL 轉換，這裡為了簡單保持 OpenCV 原生
+
+    # 疊加建議文字 (背景黑條)
+    h, w = annotated_frame.shape[:2]
+    cv2.rectangle(annotated_frame, (0, h-60), (w, h), (0, 0, 0), -1)
+    cv2.putText(annotated_frame, advice, (20, h-20),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+
+    cv2.imshow("Mahjong AI Tester", annotated_frame)
+
+
 def main():
     # ── 1. 載入模型 ──────────────────────────────────────────────
     # 假設你的模型在 runs/detect/train/weights/best.pt
-    # 如果找不到，請修改這裡的路徑
-    model_path = 'best.pt' 
-    
-    print(f"Loading YOLO model from: {model_path} ...")
+    # 如果找不到，請修改這裡的路徑 (或由命令列指定)
+    parser = argparse.ArgumentParser(description="攝影機即時辨識 + 牌效建議測試")
+    parser.add_argument('model', nargs='?', default='best.pt', help="模型路徑 (.pt / .onnx)")
+    parser.add_argument('--threads', type=int, default=None, help="ONNX 執行緒數")
+    args = parser.parse_args()
+    model_path = args.model
+    threads = args.threads
+
+    # .onnx → ONNX Runtime 後端，其餘交給 ultralytics
+    backend = 'onnx' if model_path.endswith('.onnx') else 'ultralytics'
+
+    print(f"Loading {backend} model from: {model_path} ...")
     try:
-        model = YOLO(model_path)
+        model = load_detector(backend, model_path, threads=threads)
     except Exception as e:
         print(f"[Error] Failed to load model: {e}")
         print("Tip: Make sure you have a trained 'best.pt' in this folder or specify the correct path.")
@@ -40,6 +83,8 @@ def main():
     
     frame_count = 0
     last_advice = "Waiting..."
+    river_cache = vision_bridge.RiverCache()
+    quit_requested = False
     
     while True:
         ret, frame = cap.read()
@@ -47,33 +92,35 @@ def main():
             break
             
         frame_count += 1
-        
+
+        # 顯示原始影像 (process_frame 只回傳文字，這裡另外畫出偵測框)
+        detections = model.detect(frame)
+
         # ── 3. 每 30 幀 (約 1 秒) 計算一次建議，避免太卡 ───────────
         if frame_count % 30 == 0:
             print("Analyzing...")
-            advice = vision_bridge.process_frame(frame, model)
-            last_advice = advice
+
+            # 暫定建議先畫上去，不必等完整計算
+            # (waitKey 才會更新視窗；計算中按下的 'q' 也要記下來，不能丟掉)
+            def on_update(advice):
+                nonlocal quit_requested
+                show_frame(frame, detections, advice)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    quit_requested = True
+
+            last_advice = vision_bridge.process_frame(
+                frame, model,
+                deadline_ms=DECISION_DEADLINE_MS,
+                on_update=on_update,
+                river_cache=river_cache,
+            )
             print(f"Result: {last_advice}")
+            if quit_requested:
+                break
 
         # ── 4. 畫面顯示 ──────────────────────────────────────────
-        # 畫上建議文字 (注意: cv2.putText 不支援中文，這裡顯示 ASCII 或簡單資訊)
-        # 如果需要中文，需使用 PIL 轉換，這裡為了簡單保持 OpenCV 原生
-        
-        # 顯示原始影像 (YOLO 會自動畫框，但這裡我們手動呼叫的 process_frame 只回傳文字)
-        # 如果要看 YOLO 框，可以用 results = model(frame); annotated = results[0].plot()
-        
-        # 這裡簡單疊加 YOLO 預設繪圖
-        results = model(frame, verbose=False) # verbose=False 減少 log
-        annotated_frame = results[0].plot()
-        
-        # 疊加建議文字 (背景黑條)
-        h, w = annotated_frame.shape[:2]
-        cv2.rectangle(annotated_frame, (0, h-60), (w, h), (0, 0, 0), -1)
-        cv2.putText(annotated_frame, last_advice, (20, h-20), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-
-        cv2.imshow("Mahjong AI Tester", annotated_frame)
-        
+        show_frame(frame, detections, last_advice)
+
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
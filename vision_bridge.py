@@ -2,7 +2,10 @@
 # 麻將 AI 視覺橋接器 — YOLO 辨識 + Python 牌效計算
 # ──────────────────────────────────────────────────────────────
 
-from mahjong_logic import calculate_decision
+import time
+
+from detectors import as_detector
+from mahjong_logic import calculate_decision, calculate_decision_anytime
 
 
 # ── YOLO Class ID → 牌名 對照表 ─────────────────────────────
@@ -53,6 +56,9 @@ TILE_DISPLAY_NAME = {
 def ask_brain_for_decision(
     tiles_list: list[str],
     visible_tiles: list[str] | None = None,
+    top_k: int | None = None,
+    deadline_ms: float | None = None,
+    on_update=None,
 ) -> dict | None:
     """
     呼叫 Python 牌效計算引擎 (mahjong_logic)。
@@ -60,10 +66,18 @@ def ask_brain_for_decision(
     輸入:
         tiles_list: ['1m', '2m', '3m', ...]  (16 或 17 張手牌)
         visible_tiles: ['3z', '5m', ...] (場上可見的牌河/明牌)
+        top_k: 只需要前 k 名打牌候選時指定 (見 calculate_decision)
+        deadline_ms: 時間預算 (毫秒)，時間到就回傳目前最好的結果
+        on_update: 每完成一個計算階段就呼叫 on_update(result) (見 iter_decision)
     輸出: 計算結果 dict，或 None (失敗時)
     """
     try:
-        data = calculate_decision(tiles_list, visible_tiles)
+        if deadline_ms is None and on_update is None:
+            data = calculate_decision(tiles_list, visible_tiles, top_k=top_k)
+        else:
+            data = calculate_decision_anytime(
+                tiles_list, visible_tiles, deadline_ms, on_update, top_k=top_k
+            )
 
         if data is None:
             print("[Brain Error] calculate_decision returned None")
@@ -80,71 +94,195 @@ def ask_brain_for_decision(
         return None
 
 
-def process_frame(frame, model) -> str:
+# ── 影像區域 (ROI) 設定 ─────────────────────────────────────
+# 空間分界線：畫面下方 40% 為手牌區，上方 60% 為牌河/公開區
+HAND_REGION_RATIO = 0.6
+
+# 裁切時上下多保留的重疊比例，避免壓在分界線上的牌被切掉。
+# 碰到裁切邊的框只是被切掉一部分的牌，中心點不可信，一律不計；
+# 只要牌高小於 2 × 重疊 (畫面高度的 20%)，這種牌的真正中心一定在分界線
+# 另一側，由另一個區域完整看到並計算，歸屬與整張畫面推論相同，不會重複計算。
+ROI_OVERLAP_RATIO = 0.1
+# 框邊與裁切邊的距離在此以內就視為碰到裁切邊 (像素，裁切區域座標)
+ROI_EDGE_TOLERANCE_PX = 1.0
+
+# 手牌區每次都以高解析度推論 (長邊與原全畫面推論相同，但面積只有約 50%)
+HAND_IMGSZ = 640
+# 牌河一巡才變一次 → 較低解析度，且距離上次辨識超過 N 秒才重新推論
+# (以經過時間計算，與呼叫端多久呼叫一次 process_frame 無關)。
+# 間隔要明顯大於呼叫端的週期才有節省: test_camera.py 約每 1 秒呼叫一次，
+# 每 3 秒更新一次牌河 → 約 2/3 的呼叫沿用快取
+RIVER_IMGSZ = 416
+RIVER_REFRESH_SEC = 3.0
+
+# 過濾低信心度 (< 60%)
+MIN_CONFIDENCE = 0.6
+
+
+class RiverCache:
     """
-    處理單一影格：YOLO 辨識 → 空間分類 → 牌效計算 → 回傳建議字串。
+    牌河辨識結果快取 (跨影格沿用)。
+    每個攝影機來源 / 模型應各自建立一個，避免彼此共用牌河。
 
     參數:
-        frame: OpenCV 影像 (numpy ndarray)
-        model: YOLO 模型實例
-
-    回傳:
-        建議字串，例如 "建議打: 三西 (進牌: 8張, 向聽: 1)"
+        refresh_sec: 快取的有效秒數，超過就重新辨識牌河
     """
-    # ── 1. YOLO 推論 ──
-    results = model(frame)
-    frame_height = frame.shape[0]
 
-    # 空間分界線：畫面下方 40% 為手牌區，上方 60% 為牌河/公開區
-    HAND_REGION_RATIO = 0.6
-    hand_boundary_y = frame_height * HAND_REGION_RATIO
+    def __init__(self, refresh_sec: float = RIVER_REFRESH_SEC):
+        self.refresh_sec = refresh_sec
+        self.reset()
+
+    def reset(self) -> None:
+        """清除快取，下一次 detect_tiles_roi 會立即重新辨識牌河。"""
+        self.tiles: list[str] = []
+        self.shape = None
+        self.updated_at: float | None = None
+
+    def is_stale(self, shape, now: float) -> bool:
+        # 畫面尺寸改變 (換了來源) 時強制更新
+        return (
+            self.updated_at is None
+            or self.shape != shape
+            or now - self.updated_at >= self.refresh_sec
+        )
+
+    def update(self, tiles: list[str], shape, now: float) -> None:
+        self.tiles = tiles
+        self.shape = shape
+        self.updated_at = now
+
 
-    hand_tiles = []      # 手牌
-    visible_tiles = []   # 場上可見牌 (牌河、明牌等)
+# 未指定 river_cache 時共用的預設快取 (只適合單一來源；多來源請各自建立 RiverCache)
+_default_river_cache = RiverCache()
 
-    for box in results[0].boxes:
-        cls_id = int(box.cls[0])
-        conf = float(box.conf[0])
 
-        # 過濾低信心度 (< 60%)
-        if conf < 0.6:
+def reset_river_cache() -> None:
+    """清除預設的牌河快取。"""
+    _default_river_cache.reset()
+
+
+def _collect_tiles(detections, offset_y: float, keep) -> list[str]:
+    """
+    將偵測結果轉為牌名列表。
+
+    參數:
+        detections: detector.detect(...) 的回傳值 (list[Detection])
+        offset_y: 裁切區域在原畫面中的 y 起點 (換算回原畫面座標用)
+        keep: 以原畫面中心 y 座標判斷是否保留的函式
+    """
+    tiles = []
+
+    for det in detections:
+        if det.conf < MIN_CONFIDENCE:
             continue
 
-        tile_name = YOLO_MAP.get(cls_id)
+        tile_name = YOLO_MAP.get(det.cls)
         if not tile_name:
             continue
 
         # 取得 bounding box 的中心 y 座標
-        # box.xyxy[0] = [x1, y1, x2, y2]
-        coords = box.xyxy[0]
-        center_y = (float(coords[1]) + float(coords[3])) / 2
+        # det.xyxy = (x1, y1, x2, y2)
+        center_y = (det.xyxy[1] + det.xyxy[3]) / 2 + offset_y
 
-        if center_y > hand_boundary_y:
-            # 在下方 → 手牌
-            hand_tiles.append(tile_name)
-        else:
-            # 在上方 → 牌河/公開牌
-            visible_tiles.append(tile_name)
+        if keep(center_y):
+            tiles.append(tile_name)
 
-    # ── 2. 張數檢查 (只檢查手牌) ──
-    n = len(hand_tiles)
-    remainder = n % 3
+    return tiles
 
-    if remainder == 0 or n < 13:
-        vis_info = f", 場上: {len(visible_tiles)}張" if visible_tiles else ""
-        return f"辨識中... (手牌: {n}張{vis_info})"
 
-    # ── 3. 呼叫計算引擎 (傳入可見牌) ──
-    decision = ask_brain_for_decision(
-        hand_tiles,
-        visible_tiles if visible_tiles else None,
+def _whole_boxes(detections, crop_height: int, cut_top: bool, cut_bottom: bool) -> list:
+    """
+    去掉碰到裁切邊的框 (牌被裁掉一部分，中心點位置不可信)。
+
+    參數:
+        crop_height: 裁切區域的高度
+        cut_top / cut_bottom: 上 / 下邊是否為裁切邊 (原畫面的邊不算)
+    """
+    whole = []
+    for det in detections:
+        if cut_top and det.xyxy[1] <= ROI_EDGE_TOLERANCE_PX:
+            continue
+        if cut_bottom and det.xyxy[3] >= crop_height - ROI_EDGE_TOLERANCE_PX:
+            continue
+        whole.append(det)
+    return whole
+
+
+def detect_tiles_full_frame(frame, detector) -> tuple[list[str], list[str]]:
+    """
+    整張畫面推論一次，再依分界線拆分手牌 / 場上可見牌。
+
+    參數:
+        detector: 偵測後端 (見 detectors.py)
+
+    回傳: (hand_tiles, visible_tiles)
+    """
+    results = detector.detect(frame)
+    hand_boundary_y = frame.shape[0] * HAND_REGION_RATIO
+
+    hand_tiles = _collect_tiles(results, 0.0, lambda y: y > hand_boundary_y)
+    visible_tiles = _collect_tiles(results, 0.0, lambda y: y <= hand_boundary_y)
+    return hand_tiles, visible_tiles
+
+
+def detect_tiles_roi(
+    frame,
+    detector,
+    river_cache: RiverCache | None = None,
+    now: float | None = None,
+) -> tuple[list[str], list[str]]:
+    """
+    分區 (ROI) 推論：
+      - 手牌區 (分界線以下): 每次裁切後以 HAND_IMGSZ 推論
+      - 牌河區 (分界線以上): 以 RIVER_IMGSZ 推論，快取超過 refresh_sec 秒才更新，
+        其餘影格沿用快取結果
+    碰到裁切邊的框不計 (見 ROI_OVERLAP_RATIO)，壓線的牌只會歸到一邊。
+
+    參數:
+        river_cache: 牌河快取 (None = 模組預設快取，所有呼叫端共用)
+        now: 目前時間 (秒)；None = time.monotonic()。播放錄影時可傳入影格時間
+
+    回傳: (hand_tiles, visible_tiles)，格式與 detect_tiles_full_frame 相同
+    """
+    frame_height = frame.shape[0]
+    hand_boundary_y = frame_height * HAND_REGION_RATIO
+    overlap = int(frame_height * ROI_OVERLAP_RATIO)
+
+    # ── 手牌區: 每次都推論 ──
+    hand_top = max(0, int(hand_boundary_y) - overlap)
+    hand_results = _whole_boxes(
+        detector.detect(frame[hand_top:], imgsz=HAND_IMGSZ),
+        frame_height - hand_top, cut_top=hand_top > 0, cut_bottom=False,
+    )
+    hand_tiles = _collect_tiles(
+        hand_results, float(hand_top), lambda y: y > hand_boundary_y
     )
 
-    if decision is None:
-        return "計算失敗"
+    # ── 牌河區: 低解析度 + 降頻 ──
+    cache = river_cache if river_cache is not None else _default_river_cache
+    now = time.monotonic() if now is None else now
+    if cache.is_stale(frame.shape, now):
+        river_bottom = min(frame_height, int(hand_boundary_y) + overlap)
+        river_results = _whole_boxes(
+            detector.detect(frame[:river_bottom], imgsz=RIVER_IMGSZ),
+            river_bottom, cut_top=False, cut_bottom=river_bottom < frame_height,
+        )
+        cache.update(
+            _collect_tiles(river_results, 0.0, lambda y: y <= hand_boundary_y),
+            frame.shape,
+            now,
+        )
 
-    # ── 4. 格式化結果 ──
+    return hand_tiles, list(cache.tiles)
+
+
+def format_advice(decision: dict) -> str:
+    """
+    將計算結果格式化為建議字串。
+    漸進式結果 (complete 為 False) 會標示為暫定。
+    """
     shanten = decision.get('shanten', '?')
+    pending = " …" if decision.get('complete') is False else ""
 
     if shanten == 0:
         # 聽牌了！
@@ -152,7 +290,7 @@ def process_frame(frame, model) -> str:
         waiting_tiles = ', '.join(
             TILE_DISPLAY_NAME.get(t, t) for t in accepting.keys()
         )
-        return f"🀄 聽牌！ 等: {waiting_tiles}"
+        return f"🀄 聽牌！ 等: {waiting_tiles}{pending}"
 
     if shanten == -1:
         return "🎉 已胡牌！"
@@ -161,14 +299,77 @@ def process_frame(frame, model) -> str:
     if decision.get('phase') == 'discarding' and decision.get('candidates'):
         best = decision['candidates'][0]
         discard_name = TILE_DISPLAY_NAME.get(best['discard'], best['discard'])
+        if 'ukeire' not in best:
+            # 第 1 階段只有向聽數
+            return f"建議打: {discard_name} (向聽: {shanten}){pending}"
         return (
             f"建議打: {discard_name} "
-            f"(進牌: {best['ukeire']}張, 向聽: {shanten})"
+            f"(進牌: {best['ukeire']}張, 向聽: {shanten}){pending}"
         )
 
     # 等待摸牌
     total = decision.get('totalUkeire', '?')
-    return f"向聽: {shanten}, 有效進張: {total}種"
+    return f"向聽: {shanten}, 有效進張: {total}種{pending}"
+
+
+def process_frame(
+    frame,
+    model,
+    use_roi: bool = True,
+    deadline_ms: float | None = None,
+    on_update=None,
+    river_cache: RiverCache | None = None,
+) -> str:
+    """
+    處理單一影格：YOLO 辨識 → 空間分類 → 牌效計算 → 回傳建議字串。
+
+    參數:
+        frame: OpenCV 影像 (numpy ndarray)
+        model: YOLO 模型實例，或 detectors.py 的任一偵測後端 (如 OnnxDetector)
+        use_roi: True = 手牌/牌河分區推論 (預設)，False = 整張畫面推論
+        deadline_ms: 牌效計算的時間預算 (毫秒)，時間到就回傳目前最好的建議
+        on_update: 每得到更精確的建議就呼叫 on_update(advice_str)，
+            畫面可先顯示暫定建議再逐步更新
+        river_cache: ROI 模式的牌河快取 (見 RiverCache；None = 模組預設快取)
+
+    回傳:
+        建議字串，例如 "建議打: 三西 (進牌: 8張, 向聽: 1)"
+    """
+    # ── 1. 物件偵測 (手牌 + 場上可見牌) ──
+    detector = as_detector(model)
+    if use_roi:
+        hand_tiles, visible_tiles = detect_tiles_roi(frame, detector, river_cache)
+    else:
+        hand_tiles, visible_tiles = detect_tiles_full_frame(frame, detector)
+
+    # ── 2. 張數檢查 (只檢查手牌) ──
+    n = len(hand_tiles)
+    remainder = n % 3
+
+    if remainder == 0 or n < 13:
+        vis_info = f", 場上: {len(visible_tiles)}張" if visible_tiles else ""
+        return f"辨識中... (手牌: {n}張{vis_info})"
+
+    # ── 3. 呼叫計算引擎 (傳入可見牌；畫面只顯示最佳打牌 → top_k=1) ──
+    stage_callback = None
+    if on_update is not None:
+        def stage_callback(result: dict) -> None:
+            if 'error' not in result and not result.get('complete'):
+                on_update(format_advice(result))
+
+    decision = ask_brain_for_decision(
+        hand_tiles,
+        visible_tiles if visible_tiles else None,
+        top_k=1,
+        deadline_ms=deadline_ms,
+        on_update=stage_callback,
+    )
+
+    if decision is None:
+        return "計算失敗"
+
+    # ── 4. 格式化結果 ──
+    return format_advice(decision)
 
 
 # ── 獨立測試 ──────────────────────────────────────────────────